@@ -29,3 +29,7 @@ class GenAIConfig(FrigateBaseModel):
     runtime_options: dict[str, Any] = Field(
         default={}, title="Options to pass during inference calls."
     )
+    context_cache: bool = Field(
+        default=False,
+        title="Cache images that are sent repeatedly with the GenAI provider.",
+    )
@@ -1,11 +1,12 @@
 """Generative AI module for Frigate."""
 
+import asyncio
 import datetime
 import importlib
 import logging
 import os
 import re
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
 
 from playhouse.shortcuts import model_to_dict
 
@@ -288,6 +289,33 @@ Guidelines:
         """Submit a request to the provider."""
         return None
 
+    async def _send_async(self, prompt: str, images: list[bytes]) -> Optional[str]:
+        """Submit a request to the provider without blocking the event loop.
+
+        Providers without a native async client run the blocking request in a
+        worker thread so multiple requests can be awaited concurrently.
+        """
+        return await asyncio.to_thread(self._send, prompt, images)
+
+    def _send_stream(self, prompt: str, images: list[bytes]) -> Iterator[str]:
+        """Submit a request to the provider and yield the response as it is generated.
+
+        Providers without streaming support yield the full response at once.
+        """
+        response = self._send(prompt, images)
+
+        if response:
+            yield response
+
+    def _send_batch_offline(
+        self, jobs: list[tuple[str, list[bytes]]]
+    ) -> list[Optional[str]]:
+        """Submit prompts to the provider's offline batch API and wait for the results.
+
+        Providers without an offline batch API send each prompt individually.
+        """
+        return [self._send(prompt, images) for prompt, images in jobs]
+
     def get_context_size(self) -> int:
         """Get the context window size for this provider in tokens."""
         return 4096
@@ -1,25 +1,74 @@
-"""Gemini Provider for Frigate AI."""
+"""Gemini Provider for Frigate AI.
 
+Performance notes:
+
+Requests to Gemini are network bound, nearly all of the time spent in this
+module is waiting on TLS, HTTP, and remote inference. Improvements come from
+sending fewer, better shaped requests rather than from faster Python:
+
+- concurrency: _send_async lets many requests be awaited at once
+- batching: _send_batch_offline uses the reduced cost batch API for reprocessing
+- connection reuse: a single client with keepalive pooled connections
+- caching: when enabled, repeated image sets are sent once via the context cache
+- retries and timeouts are set in _init_provider
+
+_send_async, _send_stream and _send_batch_offline are available to callers
+but are not used by the description pipeline yet, which still sends one
+request per event through _send from its own thread.
+
+The remaining CPU work is building request parts and reading response parts,
+both of which are single pass. Compiling or JIT-ing this module (Cython,
+Numba) would not make a measurable difference.
+"""
+
+import hashlib
+import json
 import logging
-from typing import Optional
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional
 
+import httpx
 from google import genai
 from google.genai import errors, types
+from pydantic import ValidationError
 
 from frigate.config import GenAIProviderEnum
 from frigate.genai import GenAIClient, register_genai_provider
 
 logger = logging.getLogger(__name__)
 
+# how long repeated image sets are kept in Gemini's context cache
+IMAGE_CACHE_TTL = 300
+# tokens used by a single thumbnail, images up to 384px are billed as one tile
+IMAGE_TOKENS = 258
+# minimum number of tokens Gemini will accept in a context cache
+CACHE_MIN_TOKENS = 1024
+CACHE_MIN_TOKENS_PRO = 4096
+# maximum number of image sets to track for context caching
+MAX_IMAGE_CACHE_ENTRIES = 64
+# how often to check the status of an offline batch job
+BATCH_JOB_POLL_INTERVAL = 30
+# how long to wait for an offline batch job before cancelling it
+BATCH_JOB_MAX_WAIT = 24 * 60 * 60
+
 
 @register_genai_provider(GenAIProviderEnum.gemini)
 class GeminiClient(GenAIClient):
     """Generative AI client for Frigate using Gemini."""
 
     provider: genai.Client
+    generate_config: types.GenerateContentConfig
+    image_caches: OrderedDict[bytes, tuple[Optional[str], float]]
 
     def _init_provider(self):
         """Initialize the client."""
+        self.image_caches = OrderedDict()
+        self.image_cache_lock = threading.Lock()
+
         # Merge provider_options into HttpOptions
         http_options_dict = {
             "timeout": int(self.timeout * 1000),  # requires milliseconds
@@ -31,32 +80,200 @@ class GeminiClient(GenAIClient):
                 jitter=1.0,
                 http_status_codes=[429, 500, 502, 503, 504],
             ),
+            # the client is reused for every request, keep pooled connections
+            # alive between events so each request doesn't pay for a new TLS handshake
+            "client_args": {
+                "limits": httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=16,
+                    keepalive_expiry=30.0,
+                ),
+            },
         }
 
         if isinstance(self.genai_config.provider_options, dict):
             http_options_dict.update(self.genai_config.provider_options)
 
+        # Merge runtime_options into generation_config, this is built once
+        # since the options do not change between requests
+        generation_config_dict = {"candidate_count": 1}
+        generation_config_dict.update(self.genai_config.runtime_options)
+
+        try:
+            self.generate_config = types.GenerateContentConfig(**generation_config_dict)
+        except ValidationError as e:
+            logger.warning(
+                "Invalid Gemini runtime_options, they will be ignored: %s", str(e)
+            )
+            self.generate_config = types.GenerateContentConfig(candidate_count=1)
+
         return genai.Client(
             api_key=self.genai_config.api_key,
             http_options=types.HttpOptions(**http_options_dict),
         )
 
+    def _build_contents(self, prompt: str, images: list[bytes]) -> types.Content:
+        """Build the request contents from the prompt and images."""
+        # build the parts directly so the SDK doesn't need to convert each item
+        if not images:
+            # text only requests, such as review summaries
+            parts = [types.Part(text=prompt)]
+        elif len(images) == 1:
+            parts = [
+                types.Part(
+                    inline_data=types.Blob(data=images[0], mime_type="image/jpeg")
+                ),
+                types.Part(text=prompt),
+            ]
+        else:
+            parts = [
+                types.Part(inline_data=types.Blob(data=img, mime_type="image/jpeg"))
+                for img in images
+            ]
+            parts.append(types.Part(text=prompt))
+
+        return types.Content(role="user", parts=parts)
+
+    def _response_text(self, response: types.GenerateContentResponse) -> Optional[str]:
+        """Get the text of the first candidate in a Gemini response."""
+        # read the parts directly rather than using response.text, which
+        # serializes every part to check for non-text content
+        if (
+            not response.candidates
+            or not response.candidates[0].content
+            or not response.candidates[0].content.parts
+        ):
+            return None
+
+        text = "".join(
+            part.text
+            for part in response.candidates[0].content.parts
+            if part.text and not part.thought
+        )
+        return text or None
+
+    def _parse_response(self, response: types.GenerateContentResponse) -> Optional[str]:
+        """Extract the description from a Gemini response."""
+        text = self._response_text(response)
+
+        if text is None:
+            # No description was generated
+            return None
+
+        return text.strip() or None
+
+    def _image_cache_key(self, images: list[bytes]) -> bytes:
+        """Get the key used to track an image set for context caching."""
+        hasher = hashlib.blake2b(digest_size=8)
+
+        for img in images:
+            hasher.update(img)
+
+        return hasher.digest()
+
+    def _get_cached_content(self, images: list[bytes]) -> Optional[str]:
+        """Get a context cache holding the images if they were sent before.
+
+        Only used by _send, other request paths always send the images.
+        """
+        min_tokens = (
+            CACHE_MIN_TOKENS_PRO
+            if "pro" in self.genai_config.model
+            else CACHE_MIN_TOKENS
+        )
+
+        if len(images) * IMAGE_TOKENS < min_tokens:
+            # too few images to be accepted as a context cache
+            return None
+
+        key = self._image_cache_key(images)
+        now = time.monotonic()
+
+        with self.image_cache_lock:
+            entry = self.image_caches.get(key)
+
+            if entry is None:
+                # only cache image sets that are described more than once
+                self.image_caches[key] = (None, 0.0)
+
+                if len(self.image_caches) > MAX_IMAGE_CACHE_ENTRIES:
+                    self.image_caches.popitem(last=False)
+
+                return None
+
+            self.image_caches.move_to_end(key)
+            name, expires = entry
+
+            if expires > now:
+                return name
+
+        try:
+            cache = self.provider.caches.create(
+                model=self.genai_config.model,
+                config=types.CreateCachedContentConfig(
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                types.Part(
+                                    inline_data=types.Blob(
+                                        data=img, mime_type="image/jpeg"
+                                    )
+                                )
+                                for img in images
+                            ],
+                        )
+                    ],
+                    ttl=f"{IMAGE_CACHE_TTL}s",
+                ),
+            )
+            name = cache.name
+        except Exception as e:
+            # the images may be below the minimum token count for caching
+            logger.debug("Unable to create Gemini context cache: %s", str(e))
+            name = None
+
+        with self.image_cache_lock:
+            # leave a margin so the cache doesn't expire mid request
+            self.image_caches[key] = (name, now + IMAGE_CACHE_TTL - 30)
+
+        return name
+
     def _send(self, prompt: str, images: list[bytes]) -> Optional[str]:
         """Submit a request to Gemini."""
-        contents = [
-            types.Part.from_bytes(data=img, mime_type="image/jpeg") for img in images
-        ] + [prompt]
-        try:
-            # Merge runtime_options into generation_config if provided
-            generation_config_dict = {"candidate_count": 1}
-            generation_config_dict.update(self.genai_config.runtime_options)
+        cached_content = (
+            self._get_cached_content(images)
+            if images and self.genai_config.context_cache
+            else None
+        )
 
+        if cached_content:
+            # the images are already in the context cache, only send the prompt
+            try:
+                response = self.provider.models.generate_content(
+                    model=self.genai_config.model,
+                    contents=self._build_contents(prompt, []),
+                    config=self.generate_config.model_copy(
+                        update={"cached_content": cached_content}
+                    ),
+                )
+                return self._parse_response(response)
+            except Exception as e:
+                logger.debug(
+                    "Gemini cached content request failed, sending images: %s",
+                    str(e),
+                )
+
+                # the cache may have been evicted or rejected, forget it so
+                # following requests don't attempt it again
+                with self.image_cache_lock:
+                    self.image_caches.pop(self._image_cache_key(images), None)
+
+        try:
             response = self.provider.models.generate_content(
                 model=self.genai_config.model,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    **generation_config_dict,
-                ),
+                contents=self._build_contents(prompt, images),
+                config=self.generate_config,
             )
         except errors.APIError as e:
             logger.warning("Gemini returned an error: %s", str(e))
@@ -65,12 +282,198 @@ class GeminiClient(GenAIClient):
             logger.warning("An unexpected error occurred with Gemini: %s", str(e))
             return None
 
+        return self._parse_response(response)
+
+    async def _send_async(self, prompt: str, images: list[bytes]) -> Optional[str]:
+        """Submit a request to Gemini without blocking the event loop."""
         try:
-            description = response.text.strip()
-        except (ValueError, AttributeError):
-            # No description was generated
+            response = await self.provider.aio.models.generate_content(
+                model=self.genai_config.model,
+                contents=self._build_contents(prompt, images),
+                config=self.generate_config,
+            )
+        except errors.APIError as e:
+            logger.warning("Gemini returned an error: %s", str(e))
             return None
-        return description
+        except Exception as e:
+            logger.warning("An unexpected error occurred with Gemini: %s", str(e))
+            return None
+
+        return self._parse_response(response)
+
+    def _send_stream(self, prompt: str, images: list[bytes]) -> Iterator[str]:
+        """Submit a request to Gemini and yield the response as it is generated.
+
+        Errors before any text is received end the stream with nothing yielded,
+        errors after text was yielded are re-raised so a partial response is
+        not mistaken for a complete one.
+        """
+        streamed = False
+
+        try:
+            for chunk in self.provider.models.generate_content_stream(
+                model=self.genai_config.model,
+                contents=self._build_contents(prompt, images),
+                config=self.generate_config,
+            ):
+                text = self._response_text(chunk)
+
+                if text:
+                    streamed = True
+                    yield text
+        except errors.APIError as e:
+            logger.warning("Gemini returned an error: %s", str(e))
+
+            if streamed:
+                raise
+        except Exception as e:
+            logger.warning("An unexpected error occurred with Gemini: %s", str(e))
+
+            if streamed:
+                raise
+
+    def _send_batch_offline(
+        self,
+        jobs: list[tuple[str, list[bytes]]],
+        max_wait: float = BATCH_JOB_MAX_WAIT,
+    ) -> list[Optional[str]]:
+        """Submit prompts to the Gemini batch API and wait for the results.
+
+        Batch jobs are billed at a reduced rate but may take hours to complete,
+        this is intended for reprocessing and not for live events. Jobs that do
+        not finish within max_wait seconds, or whose status can't be checked,
+        are cancelled.
+        """
+        if not jobs:
+            return []
+
+        generation_config = {"candidate_count": 1, **self.genai_config.runtime_options}
+        jsonl_path = None
+        input_file = None
+        batch_job = None
+
+        try:
+            # requests are uploaded as a JSONL file since inlined requests are
+            # limited in size and a backlog of images will quickly exceed it
+            with tempfile.NamedTemporaryFile(
+                "w", suffix=".jsonl", delete=False
+            ) as jsonl:
+                jsonl_path = jsonl.name
+
+                for idx, (prompt, images) in enumerate(jobs):
+                    jsonl.write(
+                        json.dumps(
+                            {
+                                "key": str(idx),
+                                "request": {
+                                    "contents": [
+                                        self._build_contents(prompt, images).model_dump(
+                                            mode="json", exclude_none=True
+                                        )
+                                    ],
+                                    "generation_config": generation_config,
+                                },
+                            }
+                        )
+                    )
+                    jsonl.write("\n")
+
+            input_file = self.provider.files.upload(
+                file=jsonl_path,
+                config=types.UploadFileConfig(
+                    display_name=f"frigate-{int(time.time())}",
+                    mime_type="jsonl",
+                ),
+            )
+            batch_job = self.provider.batches.create(
+                model=self.genai_config.model,
+                src=input_file.name,
+                config=types.CreateBatchJobConfig(
+                    display_name=f"frigate-{int(time.time())}"
+                ),
+            )
+            deadline = time.monotonic() + max_wait
+
+            while not batch_job.done:
+                if time.monotonic() > deadline:
+                    logger.warning(
+                        "Gemini batch job %s did not finish within %s seconds",
+                        batch_job.name,
+                        max_wait,
+                    )
+                    return [None] * len(jobs)
+
+                time.sleep(BATCH_JOB_POLL_INTERVAL)
+                batch_job = self.provider.batches.get(name=batch_job.name)
+
+            if batch_job.state != types.JobState.JOB_STATE_SUCCEEDED:
+                logger.warning(
+                    "Gemini batch job %s ended with state %s",
+                    batch_job.name,
+                    batch_job.state,
+                )
+                return [None] * len(jobs)
+
+            if not batch_job.dest or not batch_job.dest.file_name:
+                logger.warning("Gemini batch job %s has no results", batch_job.name)
+                return [None] * len(jobs)
+
+            results = self.provider.files.download(file=batch_job.dest.file_name)
+        except errors.APIError as e:
+            logger.warning("Gemini returned an error: %s", str(e))
+            return [None] * len(jobs)
+        except Exception as e:
+            logger.warning("An unexpected error occurred with Gemini: %s", str(e))
+            return [None] * len(jobs)
+        finally:
+            if batch_job is not None and not batch_job.done:
+                # the results will not be read, don't leave the job running
+                try:
+                    self.provider.batches.cancel(name=batch_job.name)
+                except Exception as e:
+                    logger.warning(
+                        "Unable to cancel Gemini batch job %s: %s",
+                        batch_job.name,
+                        str(e),
+                    )
+
+            if input_file is not None:
+                try:
+                    self.provider.files.delete(name=input_file.name)
+                except Exception as e:
+                    logger.debug("Unable to delete Gemini batch input: %s", str(e))
+
+            if jsonl_path is not None and os.path.exists(jsonl_path):
+                os.unlink(jsonl_path)
+
+        descriptions: list[Optional[str]] = [None] * len(jobs)
+
+        # results are not guaranteed to be in the same order as the requests
+        for line in results.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+
+            try:
+                result = json.loads(line)
+                idx = int(result["key"])
+                response = (
+                    types.GenerateContentResponse.model_validate(result["response"])
+                    if "response" in result
+                    else None
+                )
+            except (ValueError, KeyError, TypeError):
+                # ValueError includes pydantic validation errors
+                logger.warning(
+                    "Gemini batch job %s returned an invalid result", batch_job.name
+                )
+                continue
+
+            if response is None or not 0 <= idx < len(jobs):
+                continue
+
+            descriptions[idx] = self._parse_response(response)
+
+        return descriptions
 
     def get_context_size(self) -> int:
         """Get the context window size for Gemini."""
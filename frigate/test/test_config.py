@@ -1574,6 +1574,21 @@ class TestConfig(unittest.TestCase):
 
         self.assertRaises(ValueError, lambda: FrigateConfig(**config))
 
+    def test_genai_context_cache(self):
+        frigate_config = FrigateConfig(**self.minimal)
+        assert not frigate_config.genai.context_cache
+
+        config = {
+            "genai": {
+                "provider": "gemini",
+                "api_key": "test",
+                "model": "gemini-2.5-flash",
+                "context_cache": True,
+            },
+        }
+        frigate_config = FrigateConfig(**deep_merge(config, self.minimal))
+        assert frigate_config.genai.context_cache
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
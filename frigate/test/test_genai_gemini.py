@@ -0,0 +1,459 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from frigate.config import GenAIConfig
+from frigate.genai import gemini
+from frigate.genai.gemini import GeminiClient
+
+
+def text_response(text: str) -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]
+        },
+    )
+
+
+class TestGeminiRuntimeOptions(unittest.TestCase):
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return text_response("description")
+
+        self.transport = httpx.MockTransport(handler)
+
+    def create_client(self, runtime_options: dict) -> GeminiClient:
+        return GeminiClient(
+            GenAIConfig(
+                provider="gemini",
+                api_key="test",
+                model="gemini-2.5-flash",
+                runtime_options=runtime_options,
+                provider_options={
+                    "httpx_client": httpx.Client(transport=self.transport)
+                },
+            )
+        )
+
+    def test_runtime_options_are_sent(self):
+        client = self.create_client({"temperature": 0.2})
+        self.assertEqual(client._send("prompt", []), "description")
+
+        config = json.loads(self.requests[0].content)["generationConfig"]
+        self.assertEqual(config["temperature"], 0.2)
+        self.assertEqual(config["candidateCount"], 1)
+
+    def test_invalid_runtime_options_are_ignored(self):
+        # options meant for another provider must not prevent startup
+        client = self.create_client({"num_ctx": 4096})
+        self.assertEqual(client._send("prompt", []), "description")
+
+        config = json.loads(self.requests[0].content)["generationConfig"]
+        self.assertEqual(config, {"candidateCount": 1})
+
+
+class TestGeminiAsync(unittest.TestCase):
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+        self.status = 200
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+
+            if self.status != 200:
+                return httpx.Response(
+                    self.status,
+                    json={"error": {"code": self.status, "message": "bad request"}},
+                )
+
+            return text_response(" a person walks ")
+
+        transport = httpx.MockTransport(handler)
+        self.client = GeminiClient(
+            GenAIConfig(
+                provider="gemini",
+                api_key="test",
+                model="gemini-2.5-flash",
+                provider_options={
+                    "httpx_client": httpx.Client(transport=transport),
+                    "httpx_async_client": httpx.AsyncClient(transport=transport),
+                },
+            )
+        )
+
+    def test_send_async(self):
+        self.assertEqual(
+            asyncio.run(self.client._send_async("prompt", [b"image"])),
+            "a person walks",
+        )
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(self.requests[0].url.path.endswith(":generateContent"))
+        parts = json.loads(self.requests[0].content)["contents"][0]["parts"]
+        self.assertEqual(len(parts), 2)
+
+    def test_send_async_error_returns_none(self):
+        self.status = 400
+        self.assertIsNone(asyncio.run(self.client._send_async("prompt", [])))
+
+
+class FailingStream(httpx.SyncByteStream):
+    def __init__(self, chunks: list[bytes]):
+        self.chunks = chunks
+
+    def __iter__(self):
+        yield from self.chunks
+        raise httpx.ReadError("connection lost")
+
+
+class TestGeminiStream(unittest.TestCase):
+    def setUp(self):
+        self.chunks: list[str] = []
+        self.error: Exception | None = None
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if self.error:
+                raise self.error
+
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                stream=FailingStream(
+                    [
+                        f"data: {json.dumps(self.text_chunk(c))}\n\n".encode()
+                        for c in self.chunks
+                    ]
+                ),
+            )
+
+        self.client = GeminiClient(
+            GenAIConfig(
+                provider="gemini",
+                api_key="test",
+                model="gemini-2.5-flash",
+                provider_options={
+                    "httpx_client": httpx.Client(transport=httpx.MockTransport(handler))
+                },
+            )
+        )
+
+    def text_chunk(self, text: str) -> dict:
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]
+        }
+
+    def test_error_before_any_chunk_yields_nothing(self):
+        self.error = httpx.ConnectError("connection refused")
+        self.assertEqual(list(self.client._send_stream("prompt", [])), [])
+
+    def test_error_after_chunk_is_raised(self):
+        self.chunks = ["a person ", "walks"]
+        received = []
+
+        with self.assertRaises(httpx.ReadError):
+            for text in self.client._send_stream("prompt", []):
+                received.append(text)
+
+        self.assertEqual(received, ["a person ", "walks"])
+
+
+class TestGeminiContextCache(unittest.TestCase):
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+        self.cache_status = 200
+        self.cached_error: Exception | None = None
+        # four thumbnails are enough tokens to be cached on a flash model
+        self.images = [b"a", b"b", b"c", b"d"]
+
+    def create_client(
+        self, context_cache: bool = True, model: str = "gemini-2.5-flash"
+    ) -> GeminiClient:
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+
+            if request.url.path.endswith("/cachedContents"):
+                if self.cache_status != 200:
+                    return httpx.Response(
+                        self.cache_status,
+                        json={"error": {"code": self.cache_status, "message": "no"}},
+                    )
+
+                return httpx.Response(200, json={"name": "cachedContents/test"})
+
+            body = json.loads(request.content)
+
+            if body.get("cachedContent") and self.cached_error:
+                raise self.cached_error
+
+            return text_response("description")
+
+        return GeminiClient(
+            GenAIConfig(
+                provider="gemini",
+                api_key="test",
+                model=model,
+                context_cache=context_cache,
+                provider_options={
+                    "httpx_client": httpx.Client(transport=httpx.MockTransport(handler))
+                },
+            )
+        )
+
+    def cache_creates(self) -> int:
+        return len([r for r in self.requests if r.url.path.endswith("/cachedContents")])
+
+    def last_body(self) -> dict:
+        return json.loads(self.requests[-1].content)
+
+    def test_disabled_by_default(self):
+        client = self.create_client(context_cache=False)
+
+        for _ in range(3):
+            self.assertEqual(client._send("prompt", self.images), "description")
+
+        self.assertEqual(self.cache_creates(), 0)
+
+    def test_too_few_images_are_not_cached(self):
+        client = self.create_client()
+
+        for _ in range(3):
+            client._send("prompt", self.images[:1])
+
+        self.assertEqual(self.cache_creates(), 0)
+
+    def test_pro_models_need_more_images(self):
+        client = self.create_client(model="gemini-2.5-pro")
+
+        for _ in range(3):
+            client._send("prompt", self.images)
+
+        self.assertEqual(self.cache_creates(), 0)
+
+    def test_cache_created_on_second_request(self):
+        client = self.create_client()
+
+        client._send("prompt", self.images)
+        self.assertEqual(self.cache_creates(), 0)
+        self.assertNotIn("cachedContent", self.last_body())
+
+        self.assertEqual(client._send("prompt", self.images), "description")
+        self.assertEqual(self.cache_creates(), 1)
+        body = self.last_body()
+        self.assertEqual(body["cachedContent"], "cachedContents/test")
+        self.assertEqual(body["contents"][0]["parts"], [{"text": "prompt"}])
+
+        # the cache is reused while it is valid
+        client._send("prompt", self.images)
+        self.assertEqual(self.cache_creates(), 1)
+        self.assertEqual(self.last_body()["cachedContent"], "cachedContents/test")
+
+    def test_cache_recreated_after_ttl(self):
+        client = self.create_client()
+
+        with patch.object(gemini.time, "monotonic", return_value=1000.0):
+            client._send("prompt", self.images)
+            client._send("prompt", self.images)
+
+        self.assertEqual(self.cache_creates(), 1)
+
+        with patch.object(
+            gemini.time, "monotonic", return_value=1000.0 + gemini.IMAGE_CACHE_TTL
+        ):
+            client._send("prompt", self.images)
+
+        self.assertEqual(self.cache_creates(), 2)
+
+    def test_failed_cache_is_not_retried(self):
+        self.cache_status = 400
+        client = self.create_client()
+
+        with patch.object(gemini.time, "monotonic", return_value=1000.0):
+            for _ in range(3):
+                self.assertEqual(client._send("prompt", self.images), "description")
+
+        self.assertEqual(self.cache_creates(), 1)
+        self.assertNotIn("cachedContent", self.last_body())
+
+        with patch.object(
+            gemini.time, "monotonic", return_value=1000.0 + gemini.IMAGE_CACHE_TTL
+        ):
+            client._send("prompt", self.images)
+
+        self.assertEqual(self.cache_creates(), 2)
+
+    def test_cached_request_error_falls_back_to_images(self):
+        self.cached_error = httpx.ConnectTimeout("timed out")
+        client = self.create_client()
+
+        client._send("prompt", self.images)
+        self.assertEqual(client._send("prompt", self.images), "description")
+
+        body = self.last_body()
+        self.assertNotIn("cachedContent", body)
+        self.assertEqual(
+            len([p for p in body["contents"][0]["parts"] if "inlineData" in p]), 4
+        )
+
+        # the failed cache is forgotten so the next request is sent directly
+        requests = len(self.requests)
+        self.assertEqual(client._send("prompt", self.images), "description")
+        self.assertEqual(len(self.requests), requests + 1)
+        self.assertNotIn("cachedContent", self.last_body())
+
+    def test_least_recently_used_image_set_is_evicted(self):
+        client = self.create_client()
+        other_images = [b"e", b"f", b"g", b"h"]
+
+        with patch.object(gemini, "MAX_IMAGE_CACHE_ENTRIES", 1):
+            client._send("prompt", self.images)
+            client._send("prompt", other_images)
+            # the first set was evicted so this counts as a first request again
+            client._send("prompt", self.images)
+
+        self.assertEqual(self.cache_creates(), 0)
+        self.assertEqual(len(client.image_caches), 1)
+
+
+class TestGeminiBatchOffline(unittest.TestCase):
+    def setUp(self):
+        self.requests: list[httpx.Request] = []
+        self.state = "BATCH_STATE_SUCCEEDED"
+        self.poll_error: Exception | None = None
+        self.upload_path = None
+        self.results = [
+            {"key": "1", "response": self.response("second")},
+            "not json",
+            {"key": "2", "response": {"candidates": "invalid"}},
+            {"key": "0", "response": self.response("first")},
+        ]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            path = request.url.path
+
+            if path == "/upload/v1beta/files":
+                return httpx.Response(
+                    200, headers={"x-goog-upload-url": "https://upload.test/file"}
+                )
+
+            if request.url.host == "upload.test":
+                return httpx.Response(
+                    200,
+                    headers={"x-goog-upload-status": "final"},
+                    json={"file": {"name": "files/input"}},
+                )
+
+            if path.endswith(":batchGenerateContent"):
+                return httpx.Response(200, json=self.batch("BATCH_STATE_PENDING"))
+
+            if path == "/v1beta/batches/test":
+                if self.poll_error:
+                    raise self.poll_error
+
+                return httpx.Response(200, json=self.batch(self.state))
+
+            if path == "/v1beta/batches/test:cancel":
+                return httpx.Response(200, json={})
+
+            if path == "/v1beta/files/output:download":
+                return httpx.Response(
+                    200,
+                    content="\n".join(
+                        r if isinstance(r, str) else json.dumps(r) for r in self.results
+                    ).encode(),
+                )
+
+            if request.method == "DELETE":
+                return httpx.Response(200, json={})
+
+            return httpx.Response(404, json={"error": {"code": 404, "message": ""}})
+
+        self.client = GeminiClient(
+            GenAIConfig(
+                provider="gemini",
+                api_key="test",
+                model="gemini-2.5-flash",
+                provider_options={
+                    "httpx_client": httpx.Client(transport=httpx.MockTransport(handler))
+                },
+            )
+        )
+
+        original_upload = self.client.provider.files.upload
+
+        def upload(file, config):
+            self.upload_path = file
+            return original_upload(file=file, config=config)
+
+        patcher = patch.object(self.client.provider.files, "upload", upload)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch.object(gemini, "BATCH_JOB_POLL_INTERVAL", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, text: str) -> dict:
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]
+        }
+
+    def batch(self, state: str) -> dict:
+        return {
+            "name": "batches/test",
+            "metadata": {"state": state, "output": {"responsesFile": "files/output"}},
+        }
+
+    def paths(self, method: str) -> list[str]:
+        return [r.url.path for r in self.requests if r.method == method]
+
+    def jobs(self) -> list[tuple[str, list[bytes]]]:
+        return [("one", [b"a"]), ("two", []), ("three", [b"b", b"c"])]
+
+    def test_results_are_matched_by_key(self):
+        self.assertEqual(
+            self.client._send_batch_offline(self.jobs()), ["first", "second", None]
+        )
+
+        self.assertIn("/v1beta/files/input", self.paths("DELETE"))
+        self.assertNotIn("/v1beta/batches/test:cancel", self.paths("POST"))
+        self.assertFalse(os.path.exists(self.upload_path))
+
+    def test_failed_job(self):
+        self.state = "BATCH_STATE_FAILED"
+        self.assertEqual(
+            self.client._send_batch_offline(self.jobs()), [None, None, None]
+        )
+
+        self.assertNotIn("/v1beta/files/output:download", self.paths("GET"))
+        self.assertNotIn("/v1beta/batches/test:cancel", self.paths("POST"))
+
+    def test_job_cancelled_at_deadline(self):
+        self.state = "BATCH_STATE_RUNNING"
+        self.assertEqual(
+            self.client._send_batch_offline(self.jobs(), max_wait=0),
+            [None, None, None],
+        )
+
+        self.assertIn("/v1beta/batches/test:cancel", self.paths("POST"))
+        self.assertIn("/v1beta/files/input", self.paths("DELETE"))
+
+    def test_job_cancelled_when_polling_fails(self):
+        self.poll_error = httpx.ConnectError("connection reset")
+        self.assertEqual(
+            self.client._send_batch_offline(self.jobs()), [None, None, None]
+        )
+
+        self.assertIn("/v1beta/batches/test:cancel", self.paths("POST"))
+
+
+if __name__ == "__main__":
+    unittest.main()